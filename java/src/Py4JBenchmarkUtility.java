@@ -1,14 +1,31 @@
 import py4j.GatewayServer;
 
+import java.io.UnsupportedEncodingException;
+import java.lang.management.ManagementFactory;
+import java.util.ArrayList;
+import java.util.LinkedHashMap;
+import java.util.List;
+import java.util.Map;
 import java.util.Random;
 
 public class Py4JBenchmarkUtility {
 
 	public final int seed;
 	private final Random random;
+	private GatewayServer gatewayServer;
+	private String preparedString;
 
 	public static final int DEFAULT_SEED = 17;
 
+	// Same sizes as the Python tests.
+	public static final int SMALL_BYTES = 4;
+	public static final int MEDIUM_BYTES = 1024;
+	public static final int LARGE_BYTES = 1024 * 1024;
+	public static final int EXTRA_LARGE_BYTES = 25 * 1024 * 1024;
+
+	// Prevents the JIT from eliminating the baseline operations.
+	public static volatile int baselineSink;
+
 	public Py4JBenchmarkUtility(int seed) {
 		this.seed = seed;
 		random = new Random(seed);
@@ -20,6 +37,29 @@ public class Py4JBenchmarkUtility {
 		return bytes;
 	}
 
+	public void setGatewayServer(GatewayServer gatewayServer) {
+		this.gatewayServer = gatewayServer;
+	}
+
+	// The runtime metrics return primitives so that reading them does not
+	// add objects to the gateway.
+
+	public long getHeapUsed() {
+		Runtime runtime = Runtime.getRuntime();
+		return runtime.totalMemory() - runtime.freeMemory();
+	}
+
+	public int getThreadCount() {
+		return ManagementFactory.getThreadMXBean().getThreadCount();
+	}
+
+	public int getGatewayObjectCount() {
+		if (gatewayServer == null) {
+			return -1;
+		}
+		return gatewayServer.getGateway().getBindings().size();
+	}
+
 	public Object callEcho(Echo echo, Object param) {
 		return echo.echo(param);
 	}
@@ -29,6 +69,22 @@ public class Py4JBenchmarkUtility {
 		return pythonCountdown.countdown(count, javaCountdown);
 	}
 
+	/**
+	 * Builds the string returned by getPreparedString so that the string
+	 * tests only measure its transfer.
+	 */
+	public void prepareString(String unitString, int count) {
+		preparedString = repeat(unitString, count);
+	}
+
+	public String getPreparedString() {
+		return preparedString;
+	}
+
+	public static int getStringLength(String aString) {
+		return aString.length();
+	}
+
 	public static byte[] echoBytes(byte[] bytes) {
 		// Change first and last byte
 		bytes[0] = 1;
@@ -36,13 +92,180 @@ public class Py4JBenchmarkUtility {
 		return bytes;
 	}
 
+	/**
+	 * Runs in a tight Java loop the Java work performed by the standard
+	 * tests and returns the mean time in seconds of one operation, keyed by
+	 * test name. Each operation is first run warmupIterations times so it is
+	 * compiled by the JIT before being timed.
+	 */
+	public static Map<String, Double> runBaseline(int iterations,
+			int warmupIterations, String unitString, int maxBytes)
+			throws UnsupportedEncodingException {
+		Map<String, Double> baselines = new LinkedHashMap<String, Double>();
+		int unitByteSize = unitString.getBytes("UTF-8").length;
+		int largeIterations = Math.max(10, iterations / 100);
+		int extraLargeIterations = Math.max(5, iterations / 200);
+
+		baselines.put("java-instance-creation", timeOperation(
+				new BaselineOperation() {
+					@Override public int run() {
+						return new StringBuilder().length();
+					}
+				}, iterations, warmupIterations));
+
+		baselines.put("java-static-method", timeOperation(
+				new BaselineOperation() {
+					@Override public int run() {
+						return (int) System.currentTimeMillis();
+					}
+				}, iterations, warmupIterations));
+
+		baselines.put("java-list", timeOperation(new BaselineOperation() {
+			@Override public int run() {
+				List<Integer> al = new ArrayList<Integer>();
+				List<Integer> al2 = new ArrayList<Integer>();
+				List<Integer> al1orig = new ArrayList<Integer>();
+				al1orig.add(1);
+				al.add(1);
+				al2.add(2);
+				al.addAll(al2);
+				int result = al.size() + al.toString().length() +
+					(al.equals(al) ? 1 : 0);
+				result += al.get(0) + al.get(al.size() - 1);
+				result += al.subList(0, al.size() - 1).equals(al1orig) ? 1 : 0;
+				al.set(0, 2);
+				for (Integer el : al) {
+					result += el;
+				}
+				return result;
+			}
+		}, iterations, warmupIterations));
+
+		baselines.put("python-type-conversion", timeOperation(
+				new BaselineOperation() {
+					@Override public int run() {
+						StringBuilder b = new StringBuilder();
+						b.append("a");
+						b.append(-2);
+						b.append(true);
+						b.append(3000000000000L);
+						b.append(1.0 / 3.0);
+						b.append(b);
+						return b.length();
+					}
+				}, iterations, warmupIterations));
+
+		baselines.put("both-medium-string", timeValueOf(
+				repeat(unitString, Math.min(MEDIUM_BYTES, maxBytes) / unitByteSize),
+				iterations, warmupIterations));
+		baselines.put("both-large-string", timeValueOf(
+				repeat(unitString, Math.min(LARGE_BYTES, maxBytes) / unitByteSize),
+				iterations, warmupIterations));
+		baselines.put("both-extra-large-string", timeValueOf(
+				repeat(unitString,
+					Math.min(EXTRA_LARGE_BYTES, maxBytes) / unitByteSize),
+				largeIterations, warmupIterations));
+
+		baselines.put("both-small-bytes", timeEchoBytes(
+				new byte[Math.min(SMALL_BYTES, maxBytes)],
+				iterations, warmupIterations));
+		baselines.put("both-medium-bytes", timeEchoBytes(
+				new byte[Math.min(MEDIUM_BYTES, maxBytes)],
+				iterations, warmupIterations));
+		baselines.put("both-large-bytes", timeEchoBytes(
+				new byte[Math.min(LARGE_BYTES, maxBytes)],
+				largeIterations, warmupIterations));
+		baselines.put("both-extra-large-bytes", timeEchoBytes(
+				new byte[Math.min(EXTRA_LARGE_BYTES, maxBytes)],
+				extraLargeIterations, warmupIterations));
+
+		final Py4JBenchmarkUtility utility = new Py4JBenchmarkUtility(
+				DEFAULT_SEED);
+		final Echo javaEcho = new EchoImpl();
+		final Integer param = 1;
+		baselines.put("python-simple-callback", timeOperation(
+				new BaselineOperation() {
+					@Override public int run() {
+						return (Integer) utility.callEcho(javaEcho, param);
+					}
+				}, iterations, warmupIterations));
+
+		baselines.put("both-recursive-callback", timeCountdown(
+				40, iterations, warmupIterations));
+		baselines.put("both-deep-recursive-callback", timeCountdown(
+				250, iterations, warmupIterations));
+
+		return baselines;
+	}
+
+	private static double timeOperation(BaselineOperation operation,
+			int iterations, int warmupIterations) {
+		int sink = 0;
+		for (int i = 0; i < warmupIterations; i++) {
+			sink += operation.run();
+		}
+		long start = System.nanoTime();
+		for (int i = 0; i < iterations; i++) {
+			sink += operation.run();
+		}
+		long stop = System.nanoTime();
+		baselineSink = sink;
+		return (stop - start) / 1e9 / iterations;
+	}
+
+	private static double timeValueOf(final String aString, int iterations,
+			int warmupIterations) {
+		return timeOperation(new BaselineOperation() {
+			@Override public int run() {
+				return String.valueOf(aString).length();
+			}
+		}, iterations, warmupIterations);
+	}
+
+	private static double timeEchoBytes(final byte[] bytes, int iterations,
+			int warmupIterations) {
+		return timeOperation(new BaselineOperation() {
+			@Override public int run() {
+				byte[] newBytes = echoBytes(bytes);
+				return newBytes[0] + newBytes[newBytes.length - 1];
+			}
+		}, iterations, warmupIterations);
+	}
+
+	private static double timeCountdown(final int count, int iterations,
+			int warmupIterations) {
+		final Countdown countdown = new CountdownImpl();
+		return timeOperation(new BaselineOperation() {
+			@Override public int run() {
+				return startCountdown(count, countdown);
+			}
+		}, iterations, warmupIterations);
+	}
+
+	private static String repeat(String unitString, int count) {
+		StringBuilder builder = new StringBuilder(
+				unitString.length() * count);
+		for (int i = 0; i < count; i++) {
+			builder.append(unitString);
+		}
+		return builder.toString();
+	}
+
 	public static void main(String[] args) {
 		int seed = DEFAULT_SEED;
+		int pythonPort = GatewayServer.DEFAULT_PYTHON_PORT;
 		if (args.length > 0) {
 			seed = Integer.parseInt(args[0]);
 		}
+		if (args.length > 1) {
+			pythonPort = Integer.parseInt(args[1]);
+		}
 		Py4JBenchmarkUtility utility = new Py4JBenchmarkUtility(seed);
-		GatewayServer server = new GatewayServer(utility);
+		GatewayServer server = new GatewayServer(utility,
+				GatewayServer.DEFAULT_PORT, pythonPort,
+				GatewayServer.DEFAULT_CONNECT_TIMEOUT,
+				GatewayServer.DEFAULT_READ_TIMEOUT, null);
+		utility.setGatewayServer(server);
 		server.start(true);
 	}
 
@@ -54,6 +277,16 @@ public class Py4JBenchmarkUtility {
 		int countdown(int count, Countdown countdownObject);
 	}
 
+	public static interface BaselineOperation {
+		int run();
+	}
+
+	public static class EchoImpl implements Echo {
+		@Override public Object echo(Object param) {
+			return param;
+		}
+	}
+
 	public static class CountdownImpl implements Countdown {
 		@Override public int countdown(int count, Countdown countdownObject) {
 			if (count == 0) {
@@ -1,14 +1,28 @@
 import py4j.ClientServer;
+import py4j.GatewayServer;
+
+import javax.net.ServerSocketFactory;
+import javax.net.SocketFactory;
 
 public class Py4JPinnedThreadBenchmarkUtility {
 
 	public static void main(String[] args) {
 		int seed = Py4JBenchmarkUtility.DEFAULT_SEED;
+		int pythonPort = GatewayServer.DEFAULT_PYTHON_PORT;
 		if (args.length > 0) {
 			seed = Integer.parseInt(args[0]);
 		}
+		if (args.length > 1) {
+			pythonPort = Integer.parseInt(args[1]);
+		}
 		Py4JBenchmarkUtility utility = new Py4JBenchmarkUtility(seed);
-		ClientServer clientServer = new ClientServer(utility);
+		ClientServer clientServer = new ClientServer(
+				GatewayServer.DEFAULT_PORT, GatewayServer.defaultAddress(),
+				pythonPort, GatewayServer.defaultAddress(),
+				GatewayServer.DEFAULT_CONNECT_TIMEOUT,
+				GatewayServer.DEFAULT_READ_TIMEOUT,
+				ServerSocketFactory.getDefault(), SocketFactory.getDefault(),
+				utility);
 		// Necessary for earlier versions of Py4J
 		clientServer.startServer(true);
 	}
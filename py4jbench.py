@@ -1,20 +1,29 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 import argparse
+from bisect import bisect, insort
 import codecs
 from collections import OrderedDict, namedtuple, deque
+from copy import copy
 import csv
 import datetime
 import gc
-from math import sqrt
+import json
+from math import ceil, floor, sqrt
 import os
 import random
 import platform
+import socket
 import subprocess
 import sys
-from threading import Thread
+from threading import Thread, Lock, active_count
 from time import time, sleep
 
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue  # noqa
+
 DEFAULT_MAX_BYTES = 268435456
 
 DEFAULT_MAX_ITERATIONS = 100
@@ -45,11 +54,85 @@ PINNED_THREAD_CLASS_NAME = "Py4JPinnedThreadBenchmarkUtility"
 
 DEFAULT_CSV_ENCODING = "ascii"
 
+DEFAULT_TRACE_ENCODING = "utf-8"
+
+DEFAULT_HOST = "127.0.0.1"
+
+DEFAULT_GATEWAY_PORT = 25333
+
+DEFAULT_PYTHON_PORT = 25334
+
+DEFAULT_RECORD_PORT = 25335
+
+# Ports of the relays emulating a network link between Python and the JVM
+EMULATED_GATEWAY_PORT = 25343
+
+EMULATED_PYTHON_PORT = 25344
+
+# Maximum number of chunks delayed by an emulated link before the relay stops
+# reading from the sender, like a full TCP window.
+EMULATED_QUEUE_SIZE = 64
+
+DEFAULT_REPLAY_SPEED = 1.0
+
+SOCKET_BUFFER_SIZE = 65536
+
+# Py4J commands are terminated by a line containing only "e"
+COMMAND_END_LINE = b"e"
+
+SHUTDOWN_COMMAND_PREFIX = "s\n"
+
+REPLAY_TEST_NAME = "replay"
+
+DEFAULT_BASELINE_ITERATIONS = 10000
+
+DEFAULT_SOAK_INTERVAL = 60.0
+
+DEFAULT_SOAK_ITERATIONS = 10
+
+JSONL_FORMAT = "jsonl"
+
+PROMETHEUS_FORMAT = "prometheus"
+
+DEFAULT_SOAK_METRICS_FILES = {
+    JSONL_FORMAT: "soak-metrics.jsonl",
+    PROMETHEUS_FORMAT: "soak-metrics.prom",
+}
+
+# Maximum number of latencies kept per test and per window during a soak
+SOAK_RESERVOIR_SIZE = 1024
+
+# A jsonl metrics file is rotated once it reaches this size (64 MB)
+SOAK_METRICS_MAX_BYTES = 64 * 1024 * 1024
+
+SOAK_PERCENTILES = [("p50", 0.5), ("p90", 0.9), ("p99", 0.99)]
+
 GC_COLLECT_RUN = 3
 
+MEAN_STATISTIC = "mean"
+
+MEDIAN_STATISTIC = "median"
+
+DEFAULT_TARGET_PRECISION = 0.01
+
+DEFAULT_MAX_TIME = 30.0
+
+MIN_ADAPTIVE_ITERATIONS = 10
+
+# z value of a two-sided 95% confidence interval
+CONFIDENCE_Z = 1.96
+
+# t values of a two-sided 95% confidence interval, indexed by degrees of
+# freedom - 1. CONFIDENCE_Z is used beyond 30 degrees of freedom.
+CONFIDENCE_T = [
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
 HEADER = ["test", "iterations", "mean", "stddev", "total", "python version",
           "java version", "py4j version", "os version", "benchmark version",
-          "cpu count", "date"]
+          "cpu count", "date", "precision", "baseline", "overhead",
+          "overhead ratio", "throughput (MB/s)"]
 
 STD_JAVA_SOURCE_FILE = "java/src/{0}.java".format(STD_CLASS_NAME)
 
@@ -61,8 +144,31 @@ DEFAULT_STRING = "Hello\nWorld\n\nTest1234567\néééééééééééééèèè
 
 DEFAULT_STRING_BYTE_SIZE = len(DEFAULT_STRING.encode("utf-8"))
 
+# Strings of 64 bytes once encoded to utf-8 whose escaping and encoding cost
+# differ: no escaping and one byte per character, only characters escaped by
+# Py4J, two and three bytes per character, and surrogate pairs.
+STRING_CLASSES = OrderedDict([
+    ("ascii",
+     "The quick brown fox jumps over the lazy dog. 0123456789 ABCDEFGH"),
+    ("escaped", "\n\\" * 32),
+    ("bmp", "éèàçüöñß日本語の漢字と中文한국어テスト。"),
+    ("astral", "\U0001F600\U0001F680\U0001F4A9\U0001F389" * 4),
+])
+
+STRING_SIZES = OrderedDict([
+    ("medium", MEDIUM_BYTES),
+    ("large", LARGE_BYTES),
+])
+
 BenchStats = namedtuple(
-    "BenchStats", ["iterations", "mean", "stddev", "total", "timestamp"])
+    "BenchStats",
+    ["iterations", "mean", "stddev", "total", "timestamp", "precision",
+     "payload_bytes"])
+
+NetworkLink = namedtuple("NetworkLink", ["rtt", "jitter", "bandwidth"])
+
+AdaptiveSettings = namedtuple(
+    "AdaptiveSettings", ["target_precision", "max_time", "statistic"])
 
 __version__ = "0.1.0"
 
@@ -83,6 +189,12 @@ def verbose_print(message):
 
 vprint = null_print
 
+# Set by main when iterations are determined by the achieved precision.
+adaptive_settings = None
+
+# Called with the duration of each iteration when set, e.g., during a soak.
+sample_listener = None
+
 
 # UTILITY HERE
 
@@ -191,10 +303,59 @@ class OnlineStats(object):
         return sqrt(self.variance)
 
 
+def mean_precision(online_stats):
+    """Computes the half width of the 95% confidence interval of the mean,
+    relative to the mean.
+    """
+    n = online_stats.size
+    if n < 2 or online_stats.mean <= 0:
+        return float("inf")
+    if n - 1 <= len(CONFIDENCE_T):
+        t = CONFIDENCE_T[n - 2]
+    else:
+        t = CONFIDENCE_Z
+    return t * online_stats.std / sqrt(n) / online_stats.mean
+
+
+def median_precision(sorted_samples):
+    """Computes the half width of the distribution-free 95% confidence
+    interval of the median, relative to the median.
+
+    The bounds of the interval are the order statistics whose 1-based ranks
+    are floor(n/2 - z*sqrt(n)/2) and ceil(1 + n/2 + z*sqrt(n)/2), given by
+    the normal approximation of the binomial distribution.
+    """
+    n = len(sorted_samples)
+    if n < 2:
+        return float("inf")
+    middle = n // 2
+    if n % 2:
+        median = sorted_samples[middle]
+    else:
+        median = (sorted_samples[middle - 1] + sorted_samples[middle]) / 2.0
+    if median <= 0:
+        return float("inf")
+    rank_offset = CONFIDENCE_Z * sqrt(n) / 2.0
+    lower = max(0, int(floor(n / 2.0 - rank_offset)) - 1)
+    upper = min(n - 1, int(ceil(n / 2.0 + rank_offset)))
+    return (sorted_samples[upper] - sorted_samples[lower]) / 2.0 / median
+
+
 def benchmark(function, startup, cleanup, iterations):
+    """Runs function and returns its timing statistics.
+
+    By default, function is run iterations times. In adaptive mode,
+    iterations is ignored and function is run until the confidence interval
+    of the selected statistic is narrow enough or until the maximum time has
+    elapsed.
+    """
+    settings = adaptive_settings
+    statistic = settings.statistic if settings else MEAN_STATISTIC
     online_stats = OnlineStats()
+    sorted_samples = []
     timestamp = datetime.datetime.now()
-    for i in range(iterations):
+    deadline = time() + settings.max_time if settings else None
+    while settings or online_stats.size < iterations:
         if startup:
             startup()
         start = time()
@@ -203,15 +364,33 @@ def benchmark(function, startup, cleanup, iterations):
         if cleanup:
             cleanup()
         online_stats.include(stop-start)
+        if sample_listener:
+            sample_listener(stop-start)
+        if statistic == MEDIAN_STATISTIC:
+            insort(sorted_samples, stop-start)
+        if settings and online_stats.size >= MIN_ADAPTIVE_ITERATIONS:
+            precision = get_precision(
+                online_stats, sorted_samples, statistic)
+            if precision <= settings.target_precision or time() >= deadline:
+                break
     return BenchStats(
-        iterations,
+        online_stats.size,
         online_stats.mean,
         online_stats.std,
         online_stats.total,
-        timestamp
+        timestamp,
+        get_precision(online_stats, sorted_samples, statistic),
+        None
     )
 
 
+def get_precision(online_stats, sorted_samples, statistic):
+    if statistic == MEDIAN_STATISTIC:
+        return median_precision(sorted_samples)
+    else:
+        return mean_precision(online_stats)
+
+
 # TESTS HERE
 class Echo(object):
     def echo(self, param):
@@ -483,6 +662,79 @@ def both_deep_recursive_callback(options, gateway):
     return benchmark(func, None, cleanup, options.max_iterations)
 
 
+def make_string(unit_string, size):
+    """Repeats unit_string to get a string of at most size bytes once encoded
+    to utf-8.
+    """
+    return unit_string * (size // len(unit_string.encode("utf-8")))
+
+
+def get_throughput(stat):
+    """Returns the number of MB transferred per second or None if the test
+    does not report its payload.
+    """
+    if not stat.payload_bytes or stat.mean <= 0:
+        return None
+    return stat.payload_bytes / stat.mean / 1000000
+
+
+def string_to_java(unit_string, size):
+    """Creates a test sending a string of the given class and size to Java,
+    which only returns its length.
+    """
+
+    def test(options, gateway):
+        a_string = make_string(unit_string, min(size, options.max_bytes))
+        getStringLength = gateway.jvm.Py4JBenchmarkUtility.getStringLength
+        # Java counts utf-16 code units
+        java_length = len(a_string.encode("utf-16-le")) // 2
+
+        def func():
+            assert getStringLength(a_string) == java_length
+
+        stats = benchmark(
+            func, None, run_gc_collect, options.max_iterations)
+        return stats._replace(payload_bytes=len(a_string.encode("utf-8")))
+
+    return test
+
+
+def string_from_java(unit_string, size):
+    """Creates a test receiving a string of the given class and size built
+    in advance by Java.
+    """
+
+    def test(options, gateway):
+        a_string = make_string(unit_string, min(size, options.max_bytes))
+        count = len(a_string) // len(unit_string)
+        gateway.entry_point.prepareString(unit_string, count)
+        getPreparedString = gateway.entry_point.getPreparedString
+        string_length = len(a_string)
+
+        def func():
+            assert len(getPreparedString()) == string_length
+
+        stats = benchmark(
+            func, None, run_gc_collect, options.max_iterations)
+        return stats._replace(payload_bytes=len(a_string.encode("utf-8")))
+
+    return test
+
+
+def get_string_tests():
+    """Returns the string tests for each class, size, and direction.
+    """
+    tests = []
+    for class_name, unit_string in STRING_CLASSES.items():
+        for size_name, size in STRING_SIZES.items():
+            prefix = "string-{0}-{1}".format(class_name, size_name)
+            tests.append(
+                (prefix + "-to-java", string_to_java(unit_string, size)))
+            tests.append(
+                (prefix + "-from-java", string_from_java(unit_string, size)))
+    return tests
+
+
 # TODO Add loops and complicated usage with back n forth.
 
 STD_TESTS = OrderedDict([
@@ -502,7 +754,7 @@ STD_TESTS = OrderedDict([
     ("python-simple-callback", python_simple_callback),
     ("both-recursive-callback", both_recursive_callback),
     ("both-deep-recursive-callback", both_deep_recursive_callback),
-])
+] + get_string_tests())
 
 PINNED_THREAD_TESTS = OrderedDict([
     ("pinned-both-recursive-callback", both_recursive_callback),
@@ -510,6 +762,674 @@ PINNED_THREAD_TESTS = OrderedDict([
 ])
 
 
+# RECORD AND REPLAY HERE
+
+def _close_socket(a_socket):
+    try:
+        a_socket.close()
+    except socket.error:
+        pass
+
+
+def _shutdown_socket(a_socket):
+    try:
+        a_socket.shutdown(socket.SHUT_RDWR)
+    except socket.error:
+        pass
+
+
+def _shutdown_write(a_socket):
+    try:
+        a_socket.shutdown(socket.SHUT_WR)
+    except socket.error:
+        pass
+
+
+class LinkShaper(object):
+    """Computes when the data sent in one direction of an emulated network
+    link is delivered.
+
+    The data is first serialized at the link bandwidth, which is shared by
+    all connections, and then delayed by half the round trip time, plus or
+    minus a random jitter.
+    """
+
+    def __init__(self, link, seed):
+        self.link = link
+        # Do not consume the global random numbers used to generate test data
+        self.random = random.Random(seed)
+        self.lock = Lock()
+        self.link_free = 0.0
+
+    def get_delivery_time(self, size):
+        now = time()
+        with self.lock:
+            departure = max(now, self.link_free)
+            if self.link.bandwidth > 0:
+                departure += size / self.link.bandwidth
+            self.link_free = departure
+            delay = self.link.rtt / 2.0 + self.random.uniform(
+                -self.link.jitter, self.link.jitter)
+        return departure + max(0.0, delay)
+
+
+class DelayedWriter(object):
+    """Sends data to a socket at the delivery times computed by a
+    LinkShaper.
+
+    Like TCP, the order of the stream is preserved so a chunk is never
+    delivered before the previous one, whatever its jitter.
+    """
+
+    def __init__(self, destination, shaper):
+        self.destination = destination
+        self.shaper = shaper
+        self.queue = Queue(EMULATED_QUEUE_SIZE)
+        self.last_delivery = 0.0
+        t = Thread(target=self._send)
+        t.daemon = True
+        t.start()
+
+    def sendall(self, data):
+        delivery = max(
+            self.shaper.get_delivery_time(len(data)), self.last_delivery)
+        self.last_delivery = delivery
+        self.queue.put((delivery, data))
+
+    def close(self):
+        """Shuts down the destination once the delayed data is sent.
+        """
+        self.queue.put((self.last_delivery, None))
+
+    def _send(self):
+        failed = False
+        while True:
+            delivery, data = self.queue.get()
+            if data is None:
+                break
+            if failed:
+                # Keep draining the queue so the reader is never blocked.
+                continue
+            delay = delivery - time()
+            if delay > 0:
+                sleep(delay)
+            try:
+                self.destination.sendall(data)
+            except socket.error:
+                failed = True
+        _shutdown_write(self.destination)
+
+
+class TcpRelay(object):
+    """Accepts connections on a local port and forwards each of them to a
+    target port on the same host.
+
+    An optional observer is notified of each connection and of every chunk of
+    data going through the relay, before the chunk is forwarded. An optional
+    NetworkLink delays the forwarded data in both directions.
+    """
+
+    def __init__(self, listen_port, target_port, observer=None, link=None,
+                 seed=DEFAULT_SEED):
+        self.listen_port = listen_port
+        self.target_port = target_port
+        self.observer = observer
+        self.link = link
+        if link:
+            # One shaper per direction: from client and from target
+            self.shapers = {
+                True: LinkShaper(link, seed),
+                False: LinkShaper(link, seed + 1)}
+        self.server_socket = None
+        self.accept_thread = None
+        self.sockets = set()
+        self.connection_count = 0
+        self.lock = Lock()
+        self.is_running = False
+
+    def start(self):
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(
+            socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind((DEFAULT_HOST, self.listen_port))
+        self.server_socket.listen(5)
+        self.is_running = True
+        self.accept_thread = Thread(target=self._accept)
+        self.accept_thread.daemon = True
+        self.accept_thread.start()
+
+    def stop(self):
+        """Stops the relay. The listening port is free when this returns.
+        """
+        self.is_running = False
+        # Closing a socket does not wake up a thread blocked in accept() or
+        # recv(), which would keep the socket open: shut it down first.
+        _shutdown_socket(self.server_socket)
+        _close_socket(self.server_socket)
+        self.accept_thread.join()
+        with self.lock:
+            sockets = list(self.sockets)
+            self.sockets.clear()
+        for a_socket in sockets:
+            _shutdown_socket(a_socket)
+            _close_socket(a_socket)
+
+    def _accept(self):
+        while self.is_running:
+            try:
+                client_socket, _ = self.server_socket.accept()
+            except socket.error:
+                break
+            if not self.is_running:
+                _close_socket(client_socket)
+                break
+            try:
+                target_socket = socket.create_connection(
+                    (DEFAULT_HOST, self.target_port))
+            except socket.error as e:
+                vprint("Relay could not connect to port {0}: {1}".format(
+                    self.target_port, e))
+                _close_socket(client_socket)
+                continue
+
+            with self.lock:
+                connection_id = self.connection_count
+                self.connection_count += 1
+                self.sockets.update((client_socket, target_socket))
+
+            for a_socket in (client_socket, target_socket):
+                a_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self.observer:
+                self.observer.connection_opened(connection_id)
+            self._start_pipe(client_socket, target_socket, connection_id, True)
+            self._start_pipe(
+                target_socket, client_socket, connection_id, False)
+
+    def _start_pipe(self, source, destination, connection_id, from_client):
+        t = Thread(
+            target=self._pipe,
+            args=(source, destination, connection_id, from_client))
+        t.daemon = True
+        t.start()
+
+    def _pipe(self, source, destination, connection_id, from_client):
+        if self.link:
+            writer = DelayedWriter(destination, self.shapers[from_client])
+        else:
+            writer = destination
+        try:
+            while True:
+                data = source.recv(SOCKET_BUFFER_SIZE)
+                if not data:
+                    break
+                if self.observer:
+                    self.observer.data_received(
+                        connection_id, data, from_client)
+                writer.sendall(data)
+        except socket.error:
+            pass
+        finally:
+            # Half close the destination so the opposite pipe sees the end of
+            # the stream and terminates too.
+            if self.link:
+                writer.close()
+            else:
+                _shutdown_write(destination)
+            with self.lock:
+                self.sockets.discard(source)
+            _close_socket(source)
+            if self.observer and from_client:
+                self.observer.connection_closed(connection_id)
+
+
+class TraceRecorder(object):
+    """Splits the streams observed by a TcpRelay into Py4J commands and
+    responses and writes them, with their timings, to a trace file.
+
+    Each line of the trace is a json object with the connection id, the time
+    at which the command was sent (relative to the start of the recording),
+    the time it took to receive the response, the raw command, and the raw
+    response.
+    """
+
+    def __init__(self, trace_file):
+        self.trace_file = trace_file
+        self.lock = Lock()
+        self.start = time()
+        self.buffers = {}
+        self.command_lines = {}
+        self.pending = {}
+        self.command_count = 0
+        self.is_closed = False
+
+    def connection_opened(self, connection_id):
+        with self.lock:
+            self.buffers[(connection_id, True)] = b""
+            self.buffers[(connection_id, False)] = b""
+            self.command_lines[connection_id] = []
+            self.pending[connection_id] = deque()
+
+    def data_received(self, connection_id, data, from_client):
+        now = time() - self.start
+        with self.lock:
+            if self.is_closed:
+                return
+            key = (connection_id, from_client)
+            lines = (self.buffers[key] + data).split(b"\n")
+            self.buffers[key] = lines.pop()
+            for line in lines:
+                if from_client:
+                    self._command_line_received(connection_id, line, now)
+                else:
+                    self._response_received(connection_id, line, now)
+
+    def connection_closed(self, connection_id):
+        with self.lock:
+            if self.is_closed:
+                return
+            self._flush_pending(connection_id)
+
+    def close(self):
+        with self.lock:
+            for connection_id in self.pending:
+                self._flush_pending(connection_id)
+            self.is_closed = True
+
+    def _command_line_received(self, connection_id, line, now):
+        command_lines = self.command_lines[connection_id]
+        command_lines.append(line)
+        if line == COMMAND_END_LINE:
+            command = b"\n".join(command_lines) + b"\n"
+            self.pending[connection_id].append((now, command))
+            self.command_lines[connection_id] = []
+
+    def _response_received(self, connection_id, line, now):
+        pending = self.pending[connection_id]
+        if not pending:
+            vprint("Ignoring response without command on connection {0}"
+                   .format(connection_id))
+            return
+        command_time, command = pending.popleft()
+        self._write_event(
+            connection_id, command_time, now - command_time, command,
+            line + b"\n")
+
+    def _flush_pending(self, connection_id):
+        # Commands such as shutdown may never receive a response.
+        pending = self.pending[connection_id]
+        while pending:
+            command_time, command = pending.popleft()
+            self._write_event(connection_id, command_time, None, command, None)
+
+    def _write_event(self, connection_id, command_time, latency, command,
+                     response):
+        if response is not None:
+            response = response.decode(DEFAULT_TRACE_ENCODING)
+        event = OrderedDict([
+            ("connection", connection_id),
+            ("time", command_time),
+            ("latency", latency),
+            ("command", command.decode(DEFAULT_TRACE_ENCODING)),
+            ("response", response),
+        ])
+        self.trace_file.write(json.dumps(event) + "\n")
+        self.command_count += 1
+
+
+def load_trace(trace_path):
+    """Loads a trace recorded by TraceRecorder and groups its commands by
+    connection.
+
+    Shutdown commands are dropped so the replayed JVM stays available until
+    the end of the replay. Times are shifted so the first command is sent
+    immediately.
+    """
+    connections = OrderedDict()
+    with codecs.open(
+            trace_path, "r", encoding=DEFAULT_TRACE_ENCODING) as trace_file:
+        for line in trace_file:
+            line = line.strip()
+            if not line:
+                continue
+            event = json.loads(line)
+            if event["command"].startswith(SHUTDOWN_COMMAND_PREFIX):
+                continue
+            connections.setdefault(event["connection"], []).append(event)
+
+    if connections:
+        first_time = min(
+            events[0]["time"] for events in connections.values())
+        for events in connections.values():
+            for event in events:
+                event["time"] -= first_time
+    return connections
+
+
+def replay_trace(connections, port, speed):
+    """Sends the recorded commands of each connection on its own socket and
+    measures the time it takes to receive each response.
+
+    Commands are sent at their recorded time divided by speed. A speed of 0
+    sends each command as soon as the previous response is received.
+    """
+    online_stats = OnlineStats()
+    lock = Lock()
+    errors = []
+    mismatches = [0]
+    timestamp = datetime.datetime.now()
+    start = time()
+
+    def replay_connection(events):
+        try:
+            a_socket = socket.create_connection((DEFAULT_HOST, port))
+            a_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            stream = a_socket.makefile("rb")
+        except socket.error as e:
+            with lock:
+                errors.append(e)
+            return
+
+        try:
+            for event in events:
+                if speed > 0:
+                    delay = start + event["time"] / speed - time()
+                    if delay > 0:
+                        sleep(delay)
+                command_start = time()
+                a_socket.sendall(
+                    event["command"].encode(DEFAULT_TRACE_ENCODING))
+                if event["response"] is None:
+                    continue
+                response = stream.readline()
+                command_stop = time()
+                if not response:
+                    raise socket.error("Connection closed by the JVM")
+                response = response.decode(DEFAULT_TRACE_ENCODING)
+                with lock:
+                    online_stats.include(command_stop - command_start)
+                    # Object ids may differ, but success and errors should not
+                    if response[:2] != event["response"][:2]:
+                        mismatches[0] += 1
+        except socket.error as e:
+            with lock:
+                errors.append(e)
+        finally:
+            stream.close()
+            _close_socket(a_socket)
+
+    threads = [Thread(target=replay_connection, args=(events,))
+               for events in connections.values()]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    vprint("Replayed {0} commands on {1} connection(s) in {2}s".format(
+        online_stats.size, len(connections), time() - start))
+    if mismatches[0]:
+        vprint("{0} response(s) differed from the trace".format(
+            mismatches[0]))
+    if errors:
+        raise Exception("Could not replay trace: {0}".format(errors[0]))
+
+    return BenchStats(
+        online_stats.size,
+        online_stats.mean,
+        online_stats.std,
+        online_stats.total,
+        timestamp,
+        mean_precision(online_stats),
+        None
+    )
+
+
+# SOAK HERE
+
+class LatencyReservoir(object):
+    """Keeps a uniform random sample of at most size latencies, using
+    reservoir sampling, along with the exact count, total, and maximum.
+    """
+
+    def __init__(self, size, rng):
+        self.size = size
+        self.rng = rng
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = []
+
+    def include(self, latency):
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+        if len(self.samples) < self.size:
+            self.samples.append(latency)
+        else:
+            index = self.rng.randrange(self.count)
+            if index < self.size:
+                self.samples[index] = latency
+
+
+class SoakWindow(object):
+    """Collects the latencies of the tests run during one export interval of
+    a soak.
+    """
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.start = time()
+        self.test_name = None
+        self.reservoirs = OrderedDict()
+
+    def include(self, latency):
+        reservoir = self.reservoirs.get(self.test_name)
+        if reservoir is None:
+            reservoir = LatencyReservoir(SOAK_RESERVOIR_SIZE, self.rng)
+            self.reservoirs[self.test_name] = reservoir
+        reservoir.include(latency)
+
+
+def get_percentile(sorted_samples, fraction):
+    """Nearest-rank percentile.
+    """
+    if not sorted_samples:
+        return 0.0
+    rank = int(ceil(fraction * len(sorted_samples)))
+    return sorted_samples[max(0, rank - 1)]
+
+
+def get_rss_bytes():
+    """Gets the resident memory of the benchmark process or -1 if it is not
+    available on this platform.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError, ValueError, AttributeError):
+        return -1
+
+
+def get_soak_metrics(window, gateway, soak_start):
+    """Computes the metrics of a soak window and samples the current state of
+    the Python process and of the JVM.
+    """
+    now = time()
+    duration = now - window.start
+    tests = OrderedDict()
+    iterations = 0
+    for test_name, reservoir in window.reservoirs.items():
+        iterations += reservoir.count
+        sorted_samples = sorted(reservoir.samples)
+        test_metrics = OrderedDict([
+            ("iterations", reservoir.count),
+            ("throughput", reservoir.count / duration),
+            ("mean", reservoir.total / reservoir.count),
+        ])
+        for name, fraction in SOAK_PERCENTILES:
+            test_metrics[name] = get_percentile(sorted_samples, fraction)
+        test_metrics["max"] = reservoir.max
+        tests[test_name] = test_metrics
+
+    entry_point = gateway.entry_point
+    return OrderedDict([
+        ("date", datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")),
+        ("elapsed", now - soak_start),
+        ("window", duration),
+        ("iterations", iterations),
+        ("throughput", iterations / duration),
+        ("python_threads", active_count()),
+        ("python_rss_bytes", get_rss_bytes()),
+        ("python_gc_objects", len(gc.get_objects())),
+        ("jvm_threads", entry_point.getThreadCount()),
+        ("jvm_heap_used_bytes", entry_point.getHeapUsed()),
+        ("gateway_objects", entry_point.getGatewayObjectCount()),
+        ("tests", tests),
+    ])
+
+
+def write_soak_metrics_jsonl(path, metrics):
+    """Appends the metrics of a window to a json lines file, which is rotated
+    once it is too large.
+    """
+    if os.path.exists(path) and\
+            os.path.getsize(path) >= SOAK_METRICS_MAX_BYTES:
+        rotated_path = path + ".1"
+        if os.path.exists(rotated_path):
+            os.remove(rotated_path)
+        os.rename(path, rotated_path)
+    with codecs.open(path, "a", encoding=DEFAULT_TRACE_ENCODING) as f:
+        f.write(json.dumps(metrics) + "\n")
+
+
+def write_soak_metrics_prometheus(path, metrics):
+    """Replaces the content of a file with the metrics of the last window in
+    the Prometheus text format, e.g., for the node exporter textfile
+    collector.
+    """
+    lines = []
+
+    def add_gauge(name, samples):
+        lines.append("# TYPE py4jbench_{0} gauge".format(name))
+        for labels, value in samples:
+            label_text = ",".join(
+                '{0}="{1}"'.format(key, label) for key, label in labels)
+            if label_text:
+                label_text = "{" + label_text + "}"
+            lines.append("py4jbench_{0}{1} {2!r}".format(
+                name, label_text, float(value)))
+
+    for name in ["elapsed", "window", "iterations", "throughput",
+                 "python_threads", "python_rss_bytes", "python_gc_objects",
+                 "jvm_threads", "jvm_heap_used_bytes", "gateway_objects"]:
+        add_gauge(name, [((), metrics[name])])
+
+    tests = metrics["tests"]
+    for name in ["iterations", "throughput"]:
+        add_gauge("test_" + name, [
+            ((("test", test_name),), test_metrics[name])
+            for test_name, test_metrics in tests.items()])
+    add_gauge("test_latency_seconds", [
+        ((("test", test_name), ("quantile", str(fraction))),
+         test_metrics[name])
+        for test_name, test_metrics in tests.items()
+        for name, fraction in SOAK_PERCENTILES])
+    for name in ["mean", "max"]:
+        add_gauge("test_latency_{0}_seconds".format(name), [
+            ((("test", test_name),), test_metrics[name])
+            for test_name, test_metrics in tests.items()])
+
+    # Write then rename so readers never see a partial file.
+    temp_path = path + ".tmp"
+    with codecs.open(temp_path, "w", encoding=DEFAULT_TRACE_ENCODING) as f:
+        f.write("\n".join(lines) + "\n")
+    try:
+        # Atomically replaces the previous file on POSIX
+        os.rename(temp_path, path)
+    except OSError:
+        # Windows does not rename over an existing file
+        os.remove(path)
+        os.rename(temp_path, path)
+
+
+def get_soak_tests(options):
+    """Returns the names, functions, and weights of the standard tests mixed
+    during a soak.
+    """
+    if options.soak_mix:
+        weights = OrderedDict()
+        for item in options.soak_mix:
+            test_name, _, weight = item.partition("=")
+            if test_name not in STD_TESTS:
+                raise Exception("Unknown soak test: {0}".format(test_name))
+            try:
+                weights[test_name] = float(weight) if weight else 1.0
+            except ValueError:
+                raise Exception("Invalid soak weight: {0}".format(item))
+            # A weight of 0 explicitly disables a test. Also rejects nan.
+            if not 0 <= weights[test_name] < float("inf"):
+                raise Exception("Invalid soak weight: {0}".format(item))
+    else:
+        weights = OrderedDict((test_name, 1.0) for test_name in STD_TESTS)
+
+    soak_tests = []
+    for test_name, weight in weights.items():
+        if options.only_benchmarks and\
+                test_name not in options.only_benchmarks:
+            continue
+        if options.skip_benchmarks and\
+                test_name in options.skip_benchmarks:
+            continue
+        if weight > 0:
+            soak_tests.append((test_name, STD_TESTS[test_name], weight))
+    if not soak_tests:
+        raise Exception("No test selected for the soak")
+    return soak_tests
+
+
+def soak(options, gateway, soak_tests, write_metrics):
+    """Runs tests picked at random according to their weight until the soak
+    duration has elapsed and writes the metrics of each window.
+    """
+    global sample_listener
+    rng = random.Random(options.seed)
+    cumulative_weights = []
+    total_weight = 0.0
+    for _, _, weight in soak_tests:
+        total_weight += weight
+        cumulative_weights.append(total_weight)
+
+    # Short runs so the tests are interleaved.
+    soak_options = copy(options)
+    soak_options.max_iterations = options.soak_iterations
+
+    soak_start = time()
+    deadline = soak_start + options.soak_duration
+    window = SoakWindow(rng)
+    sample_listener = window.include
+    try:
+        while time() < deadline:
+            index = bisect(cumulative_weights, rng.random() * total_weight)
+            test_name, test, _ = soak_tests[min(index, len(soak_tests) - 1)]
+            window.test_name = test_name
+            test(soak_options, gateway)
+            if time() - window.start >= options.soak_interval or\
+                    time() >= deadline:
+                metrics = get_soak_metrics(window, gateway, soak_start)
+                write_metrics(options.soak_metrics, metrics)
+                vprint("Soak {0:.1f}s - iterations: {1}, throughput: "
+                       "{2:.1f}/s, jvm threads: {3}, jvm heap: {4}, "
+                       "gateway objects: {5}".format(
+                           metrics["elapsed"], metrics["iterations"],
+                           metrics["throughput"], metrics["jvm_threads"],
+                           metrics["jvm_heap_used_bytes"],
+                           metrics["gateway_objects"]))
+                window = SoakWindow(rng)
+                sample_listener = window.include
+    finally:
+        sample_listener = None
+
+
 # BENCHMARK STEPS HERE
 
 def get_parser():
@@ -548,6 +1468,80 @@ def get_parser():
         "--max-iterations", dest="max_iterations", action="store",
         type=int, default=DEFAULT_MAX_ITERATIONS,
         help="Maximum number of iterations. Determine the testing time.")
+    parser.add_argument(
+        "--adaptive", dest="adaptive", action="store_true",
+        default=False,
+        help="Run each test until the confidence interval of the selected "
+        "statistic is narrower than the target precision or until the "
+        "maximum time has elapsed. --max-iterations is ignored. Can also be "
+        "set with the PY4J_BENCHMARK_ADAPTIVE environment variable, whose "
+        "value is the target precision.")
+    parser.add_argument(
+        "--target-precision", dest="target_precision", action="store",
+        type=float, default=DEFAULT_TARGET_PRECISION,
+        help="Relative half width of the 95%% confidence interval at which "
+        "an adaptive test stops, e.g., 0.01 for +/-1%%.")
+    parser.add_argument(
+        "--max-time", dest="max_time", action="store",
+        type=float, default=DEFAULT_MAX_TIME,
+        help="Maximum number of seconds spent on an adaptive test.")
+    parser.add_argument(
+        "--adaptive-statistic", dest="adaptive_statistic", action="store",
+        choices=[MEAN_STATISTIC, MEDIAN_STATISTIC], default=MEAN_STATISTIC,
+        help="Statistic whose precision is targeted in adaptive mode.")
+    parser.add_argument(
+        "--baseline", dest="with_baseline", action="store_true",
+        default=False,
+        help="Time the Java work of the standard tests in a tight Java loop "
+        "and report the bridge overhead of each test.")
+    parser.add_argument(
+        "--baseline-iterations", dest="baseline_iterations", action="store",
+        type=int, default=DEFAULT_BASELINE_ITERATIONS,
+        help="Number of warmup and timed iterations of the in-JVM "
+        "baseline.")
+    parser.add_argument(
+        "--emulate-rtt", dest="emulate_rtt", action="store",
+        type=float, default=0.0,
+        help="Round trip time in milliseconds added between Python and the "
+        "JVM by a local relay, in both directions.")
+    parser.add_argument(
+        "--emulate-jitter", dest="emulate_jitter", action="store",
+        type=float, default=0.0,
+        help="Maximum random variation in milliseconds of each one-way "
+        "delay of the emulated link.")
+    parser.add_argument(
+        "--emulate-bandwidth", dest="emulate_bandwidth", action="store",
+        type=float, default=0.0,
+        help="Bandwidth in Mbit/s of each direction of the emulated link. "
+        "0 does not limit the bandwidth.")
+    parser.add_argument(
+        "--soak", dest="soak_duration", action="store",
+        type=float,
+        help="Run a weighted mix of the standard tests for this number of "
+        "seconds instead of running each test once.")
+    parser.add_argument(
+        "--soak-mix", dest="soak_mix", action="store",
+        nargs="*",
+        help="Tests and weights of the soak mix, e.g., "
+        "java-list=10 both-large-bytes=1. By default, all standard tests "
+        "have the same weight.")
+    parser.add_argument(
+        "--soak-iterations", dest="soak_iterations", action="store",
+        type=int, default=DEFAULT_SOAK_ITERATIONS,
+        help="Number of iterations each time a test is picked in the mix.")
+    parser.add_argument(
+        "--soak-interval", dest="soak_interval", action="store",
+        type=float, default=DEFAULT_SOAK_INTERVAL,
+        help="Number of seconds between two exports of the soak metrics.")
+    parser.add_argument(
+        "--soak-metrics", dest="soak_metrics", action="store",
+        help="Where to save the soak metrics. Defaults to "
+        "soak-metrics.jsonl or soak-metrics.prom.")
+    parser.add_argument(
+        "--soak-format", dest="soak_format", action="store",
+        choices=[JSONL_FORMAT, PROMETHEUS_FORMAT], default=JSONL_FORMAT,
+        help="Format of the soak metrics. A jsonl file receives one line "
+        "per window and a prometheus file only contains the last window.")
     parser.add_argument(
         "--max-threads", dest="max_threads", action="store",
         type=int, default=DEFAULT_THREAD_COUNT,
@@ -574,6 +1568,28 @@ def get_parser():
         nargs="*",
         help="Skip the selected benchmarks. Can also be set with the "
         "PY4J_BENCHMARK_SKIP environment variable.")
+    parser.add_argument(
+        "--record", dest="record_trace", action="store",
+        help="Record the Py4J commands of any application in a trace file. "
+        "The application must connect to the record port instead of the "
+        "gateway port. Stop the recording with Ctrl+C.")
+    parser.add_argument(
+        "--record-port", dest="record_port", action="store",
+        type=int, default=DEFAULT_RECORD_PORT,
+        help="Port on which the recording proxy listens.")
+    parser.add_argument(
+        "--gateway-port", dest="gateway_port", action="store",
+        type=int, default=DEFAULT_GATEWAY_PORT,
+        help="Port of the GatewayServer used by the recorded application.")
+    parser.add_argument(
+        "--replay", dest="replay_trace", action="store",
+        help="Replay a recorded trace instead of running the benchmark "
+        "tests.")
+    parser.add_argument(
+        "--replay-speed", dest="replay_speed", action="store",
+        type=float, default=DEFAULT_REPLAY_SPEED,
+        help="Speed multiplier applied to the recorded timings. 0 replays "
+        "the commands as fast as possible.")
     return parser
 
 
@@ -593,12 +1609,13 @@ def compile_java(javac_path, py4j_jar_path, compile_pinned_thread):
                         .format(output))
 
 
-def start_java(java_path, py4j_jar_path, main_class, max_bytes):
+def start_java(java_path, py4j_jar_path, main_class, max_bytes,
+               seed=DEFAULT_SEED, python_port=DEFAULT_PYTHON_PORT):
     """Starts a Java process"""
     java_heap_size = (max_bytes // 1024 // 1024) + 768
-    cmd_line = "{0} -Xmx{5}m -cp {1}{2}{3} {4}".format(
+    cmd_line = "{0} -Xmx{5}m -cp {1}{2}{3} {4} {6} {7}".format(
         java_path, py4j_jar_path, os.pathsep, "java/bin", main_class,
-        java_heap_size)
+        java_heap_size, seed, python_port)
     process = subprocess.Popen(cmd_line, shell=True, stdout=None, stderr=None,
                                stdin=None, close_fds=True)
     sleep(DEFAULT_SLEEP_TIME * 10)
@@ -615,7 +1632,7 @@ def has_pinned_thread():
     return False
 
 
-def get_gateway():
+def get_gateway(port=DEFAULT_GATEWAY_PORT):
     """Get Py4J JavaGateway that can work with both sides.
     """
     # Do some magic here to determine if we are running old or new py4j
@@ -625,53 +1642,205 @@ def get_gateway():
         from py4j.java_gateway import (
             GatewayParameters, CallbackServerParameters)
         return JavaGateway(
-            gateway_parameters=GatewayParameters(),
+            gateway_parameters=GatewayParameters(port=port),
             callback_server_parameters=CallbackServerParameters())
     else:
-        return JavaGateway(start_callback_server=True)
+        from py4j.java_gateway import GatewayClient
+        return JavaGateway(
+            gateway_client=GatewayClient(port=port),
+            start_callback_server=True)
 
 
-def get_pinned_thread_gateway():
+def get_pinned_thread_gateway(port=DEFAULT_GATEWAY_PORT):
     """Get Py4J ClientServer that can work with both sides.
     """
     from py4j.clientserver import (
         ClientServer, PythonParameters, JavaParameters)
     client_server = ClientServer(
-        java_parameters=JavaParameters(), python_parameters=PythonParameters())
+        java_parameters=JavaParameters(port=port),
+        python_parameters=PythonParameters())
     return client_server
 
 
-def run_standard_tests(options, results):
+def get_network_link(options):
+    """Returns the NetworkLink to emulate between Python and the JVM or None
+    if the JVM must be reached directly.
+    """
+    if not (options.emulate_rtt or options.emulate_jitter or
+            options.emulate_bandwidth):
+        return None
+    return NetworkLink(
+        options.emulate_rtt / 1000.0,
+        options.emulate_jitter / 1000.0,
+        options.emulate_bandwidth * 1000 * 1000 / 8.0)
+
+
+def start_network_emulation(options):
+    """Starts the relays emulating a network link from Python to the
+    GatewayServer and from the JVM to the Python callback server, if
+    requested.
+
+    Returns the relays, the port Python must connect to, and the port the JVM
+    must connect to.
+    """
+    link = get_network_link(options)
+    if link is None:
+        return [], DEFAULT_GATEWAY_PORT, DEFAULT_PYTHON_PORT
+
+    vprint("Emulating network link: {0}".format(link))
+    relays = [
+        TcpRelay(EMULATED_GATEWAY_PORT, DEFAULT_GATEWAY_PORT, link=link,
+                 seed=options.seed),
+        TcpRelay(EMULATED_PYTHON_PORT, DEFAULT_PYTHON_PORT, link=link,
+                 seed=options.seed + 2),
+    ]
+    for relay in relays:
+        relay.start()
+    return relays, EMULATED_GATEWAY_PORT, EMULATED_PYTHON_PORT
+
+
+def stop_network_emulation(relays):
+    for relay in relays:
+        relay.stop()
+
+
+def run_standard_tests(options, results, baselines):
     """Runs the full standard test suite.
     """
+    relays, gateway_port, python_port = start_network_emulation(options)
     start_java(options.java_path, options.py4j_jar_path, STD_CLASS_NAME,
-               options.max_bytes)
-    gateway = get_gateway()
+               options.max_bytes, options.seed, python_port)
+    gateway = get_gateway(gateway_port)
 
     try:
+        if options.with_baseline:
+            vprint("Running in-JVM baseline")
+            baselines.update(run_baseline(options, gateway))
         _run_tests(options, results, gateway, STD_TESTS)
     finally:
         gateway.shutdown()
+        stop_network_emulation(relays)
 
     sleep(DEFAULT_SLEEP_TIME * 10)
 
 
+def run_baseline(options, gateway):
+    """Runs the Java work of the standard tests in the JVM, without going
+    through Py4J, and returns the mean time of one operation by test name.
+    """
+    java_baselines = gateway.jvm.Py4JBenchmarkUtility.runBaseline(
+        options.baseline_iterations, options.baseline_iterations,
+        DEFAULT_STRING, options.max_bytes)
+    baselines = OrderedDict()
+    for test_name in java_baselines:
+        baselines[test_name] = java_baselines[test_name]
+    run_java_gc_collect(gateway)
+    return baselines
+
+
+def get_overhead(stat, baseline):
+    """Returns the bridge overhead, i.e., the measured time minus the in-JVM
+    baseline, and the ratio of the measured time to the baseline.
+    """
+    overhead = stat.mean - baseline
+    if baseline > 0:
+        ratio = stat.mean / baseline
+    else:
+        ratio = float("inf")
+    return overhead, ratio
+
+
 def run_pinned_thread_tests(options, results):
     """Runs the pinned thread test suite.
     """
+    relays, gateway_port, python_port = start_network_emulation(options)
     start_java(options.java_path, options.py4j_jar_path,
                PINNED_THREAD_CLASS_NAME,
-               options.max_bytes)
-    gateway = get_pinned_thread_gateway()
+               options.max_bytes, options.seed, python_port)
+    gateway = get_pinned_thread_gateway(gateway_port)
 
     try:
         _run_tests(options, results, gateway, PINNED_THREAD_TESTS)
     finally:
         gateway.shutdown()
+        stop_network_emulation(relays)
+
+    sleep(DEFAULT_SLEEP_TIME * 10)
+
+
+def run_replay(options, results):
+    """Replays a recorded trace against the standard utility class.
+    """
+    connections = load_trace(options.replay_trace)
+    relays, gateway_port, python_port = start_network_emulation(options)
+    start_java(options.java_path, options.py4j_jar_path, STD_CLASS_NAME,
+               options.max_bytes, options.seed, python_port)
+    gateway = get_gateway(gateway_port)
+
+    try:
+        stats = replay_trace(connections, gateway_port, options.replay_speed)
+        results[REPLAY_TEST_NAME] = stats
+        if options.verbose:
+            report_verbose_result(REPLAY_TEST_NAME, stats)
+    finally:
+        gateway.shutdown()
+        stop_network_emulation(relays)
+
+    sleep(DEFAULT_SLEEP_TIME * 10)
+
+
+def run_soak(options):
+    """Runs a weighted mix of the standard tests for a long time and
+    periodically exports metrics.
+    """
+    global adaptive_settings
+    # A soak runs the tests for a fixed duration, not until a precision.
+    adaptive_settings = None
+    soak_tests = get_soak_tests(options)
+    if options.soak_format == PROMETHEUS_FORMAT:
+        write_metrics = write_soak_metrics_prometheus
+    else:
+        write_metrics = write_soak_metrics_jsonl
+    if not options.soak_metrics:
+        options.soak_metrics = DEFAULT_SOAK_METRICS_FILES[options.soak_format]
+
+    relays, gateway_port, python_port = start_network_emulation(options)
+    start_java(options.java_path, options.py4j_jar_path, STD_CLASS_NAME,
+               options.max_bytes, options.seed, python_port)
+    gateway = get_gateway(gateway_port)
+
+    try:
+        soak(options, gateway, soak_tests, write_metrics)
+    finally:
+        gateway.shutdown()
+        stop_network_emulation(relays)
 
     sleep(DEFAULT_SLEEP_TIME * 10)
 
 
+def record_trace(options):
+    """Records the commands sent to a GatewayServer until interrupted.
+    """
+    with codecs.open(options.record_trace, "w",
+                     encoding=DEFAULT_TRACE_ENCODING) as trace_file:
+        recorder = TraceRecorder(trace_file)
+        relay = TcpRelay(options.record_port, options.gateway_port, recorder)
+        relay.start()
+        # Bypass verbose by using print
+        print("Recording commands sent to port {0} through port {1}. "
+              "Press Ctrl+C to stop.".format(
+                  options.gateway_port, options.record_port))
+        try:
+            while True:
+                sleep(DEFAULT_SLEEP_TIME * 10)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            relay.stop()
+            recorder.close()
+        print("Recorded {0} commands".format(recorder.command_count))
+
+
 def list_benchmarks(options):
     """Lists all benchmarks
     """
@@ -703,7 +1872,7 @@ def _run_tests(options, results, gateway, test_dict):
         sleep(DEFAULT_SLEEP_TIME * 2.5)
 
 
-def report_results(options, results):
+def report_results(options, results, baselines):
     csv_file_path = options.csv_output
     file_exists = os.path.exists(csv_file_path)
     mode = "a" if options.append_to_csv and file_exists else "w"
@@ -716,20 +1885,43 @@ def report_results(options, results):
         if not file_exists:
             writer.writerow(HEADER)
         for test_name, stat in results.items():
-            stat_list = list(stat)
+            if test_name in baselines:
+                baseline = baselines[test_name]
+                overhead_columns = [baseline] + list(
+                    get_overhead(stat, baseline))
+            else:
+                overhead_columns = ["", "", ""]
+            throughput = get_throughput(stat)
             writer.writerow(
-                [test_name] + stat_list[:-1] + suffix +
-                [stat.timestamp.strftime("%Y-%m-%d %H:%M:%S.%f")])
+                [test_name, stat.iterations, stat.mean, stat.stddev,
+                 stat.total] + suffix +
+                [stat.timestamp.strftime("%Y-%m-%d %H:%M:%S.%f"),
+                 stat.precision] + overhead_columns +
+                [throughput if throughput is not None else ""])
 
 
 def report_verbose_result(test_name, result):
     msg = "Test {0} - avg: {1}s, stddev: {2}s, total: {3}s, "\
-        "iterations: {4}".format(
+        "iterations: {4}, precision: +/-{5:.2%}".format(
             test_name, result.mean, result.stddev, result.total,
-            result.iterations)
+            result.iterations, result.precision)
+    throughput = get_throughput(result)
+    if throughput is not None:
+        msg += ", throughput: {0:.2f}MB/s".format(throughput)
     vprint(msg)
 
 
+def report_verbose_overhead(results, baselines):
+    for test_name, stat in results.items():
+        if test_name not in baselines:
+            continue
+        overhead, ratio = get_overhead(stat, baselines[test_name])
+        msg = "Test {0} - in-JVM baseline: {1}s, bridge overhead: {2}s, "\
+            "overhead ratio: {3:.1f}x".format(
+                test_name, baselines[test_name], overhead, ratio)
+        vprint(msg)
+
+
 def set_args_with_env_variables(args):
     limit = os.environ.get("PY4J_BENCHMARK_SKIP")
     if limit:
@@ -737,6 +1929,10 @@ def set_args_with_env_variables(args):
     only = os.environ.get("PY4J_BENCHMARK_ONLY")
     if only:
         args.only_benchmarks = only.split(" ")
+    adaptive = os.environ.get("PY4J_BENCHMARK_ADAPTIVE")
+    if adaptive:
+        args.adaptive = True
+        args.target_precision = float(adaptive)
 
 
 def main():
@@ -744,15 +1940,25 @@ def main():
     args = parser.parse_args()
     set_args_with_env_variables(args)
     results = OrderedDict()
+    baselines = OrderedDict()
 
     if args.verbose:
         global vprint
         vprint = verbose_print
 
+    if args.adaptive:
+        global adaptive_settings
+        adaptive_settings = AdaptiveSettings(
+            args.target_precision, args.max_time, args.adaptive_statistic)
+
     if args.list_benchmarks:
         list_benchmarks(args)
         return
 
+    if args.record_trace:
+        record_trace(args)
+        return
+
     vprint("Starting benchmark")
 
     vprint("Initializing random numbers")
@@ -767,16 +1973,27 @@ def main():
     vprint("Compiling java utility classe(s)")
     compile_java(args.javac_path, args.py4j_jar_path, with_pinned_thread)
 
-    vprint("Running standard tests")
-    run_standard_tests(args, results)
+    if args.replay_trace:
+        vprint("Replaying trace")
+        run_replay(args, results)
+    elif args.soak_duration:
+        vprint("Running soak")
+        run_soak(args)
+        return
+    else:
+        vprint("Running standard tests")
+        run_standard_tests(args, results, baselines)
+
+        if with_pinned_thread:
+            vprint("Running pinned thread tests")
+            run_pinned_thread_tests(args, results)
 
-    if with_pinned_thread:
-        vprint("Running pinned thread tests")
-        run_pinned_thread_tests(args, results)
+    if baselines:
+        report_verbose_overhead(results, baselines)
 
     if args.csv_output:
         vprint("Writing csv output")
-        report_results(args, results)
+        report_results(args, results, baselines)
 
 
 if __name__ == "__main__":